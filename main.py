@@ -12,6 +12,7 @@ import re
 import configparser
 import shutil
 import datetime
+import pickle
 from collections.abc import Mapping
 
 
@@ -19,6 +20,8 @@ from collections.abc import Mapping
 CUDIR: str = os.path.abspath(os.path.dirname(__file__))
 # ssh-host配置文件
 MY_CONF_FILE: str = os.path.join(CUDIR, 'ssh-host.ini')
+# ssh-host配置解析结果缓存, ssh-host.ini 大小和修改时间不变时直接加载
+MY_CONF_CACHE_FILE: str = MY_CONF_FILE + '.cache.pkl'
 # 兼容其他脚本, 目前没有使用
 GITBASH_CONF_DIR: str = os.path.join('C:\\', '1', 'gitbash', 'ssh-host.d')
 # 用户主目录（用于拼接 .ssh/config）
@@ -41,6 +44,14 @@ SSHKEY_KEEP_DIR: str = os.path.join(CUDIR, 'sshkey')
 SSHKEY_OUT_DIR: str = os.path.join('C:\\', '0', 'sshkey')
 # 默认sshkey
 DEFAULT_IDENTITY_FILE = '~/.ssh/id_rsa'
+# ssh配置解析用的正则, 预编译避免逐行查找缓存
+_HOST_WORD = re.compile(r'\bHost\b')
+# 路径分隔符, 兼容 Windows：可能混用 / 与 \
+_PATH_SEPS: tuple[str, ...] = (os.sep, os.altsep) if os.altsep else (os.sep,)
+# trans_keyfile_path 结果缓存: 源密钥路径 -> 最终密钥路径, 共用密钥的section不再重复复制
+_KEYFILE_CACHE: dict[str, str] = {}
+# SSHKEY_OUT_DIR 是否已创建, 每个进程只需创建一次
+_SSHKEY_OUT_DIR_READY: bool = False
 
 def has_path_component(name: str) -> bool:
     """
@@ -50,13 +61,25 @@ def has_path_component(name: str) -> bool:
     """
     if not name:
         return False
-    if os.path.isabs(name):
-        return True
-    # 兼容 Windows：可能混用 / 与 \
-    seps = {os.sep}
-    if os.altsep:
-        seps.add(os.altsep)
-    return any(s in name for s in seps)
+    # 常见情况是带分隔符, 先做子串判断短路; 绝对路径必然带分隔符, isabs 放最后兜底
+    for sep in _PATH_SEPS:
+        if sep in name:
+            return True
+    return os.path.isabs(name)
+
+
+def _is_host_line(lstripped: str) -> bool:
+    """已去掉行首空白的行是否以单词 Host 开头（等价于 ^\\s*\\bHost\\b）"""
+    if not lstripped.startswith('Host'):
+        return False
+    nxt = lstripped[4:5]
+    return not (nxt.isalnum() or nxt == '_')
+
+
+def _is_msys_drive_path(value: str) -> bool:
+    """是否为 /c/xxx 形式的 msys 路径（等价于 ^/[A-Za-z]/）"""
+    return (len(value) > 2 and value[0] == '/' and value[2] == '/'
+            and value[1].isascii() and value[1].isalpha())
 
 
 def is_absolute_path(name: str) -> bool:
@@ -64,26 +87,113 @@ def is_absolute_path(name: str) -> bool:
     return bool(name) and os.path.isabs(name)
 
 
+def _replace_file_keep_acl(path: str, tmp_path: str) -> bool:
+    """Windows 下用 ReplaceFileW 以 tmp_path 替换 path, 保留原文件的ACL和属性; 失败返回False"""
+    try:
+        import ctypes
+        return bool(ctypes.windll.kernel32.ReplaceFileW(path, tmp_path, None, 0, None, None))
+    except (OSError, AttributeError):
+        return False
+
+
+def write_file_atomic(path: str, payload: str) -> None:
+    """整体写入文本文件：先写同目录下的 .tmp 文件，再替换目标文件
+    - 目标是符号链接时替换链接指向的文件, 链接本身保持不变
+    - .tmp 文件创建时即使用原文件权限, 原文件不存在时为 0600
+    - Windows 下用 ReplaceFileW 保留原文件ACL, 失败时退回原地覆盖写入
+    - 写入失败时删除 .tmp 文件
+    """
+    path = os.path.realpath(path)
+    tmp_path = f'{path}.tmp'
+    target_exists = os.path.exists(path)
+    mode = os.stat(path).st_mode & 0o7777 if target_exists else 0o600
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        # 写入内容之前先设置好权限(内容含密码等信息), .tmp 可能是上次残留的, 也要重新设置
+        if hasattr(os, 'fchmod'):
+            try:
+                os.fchmod(fd, mode)
+            except OSError:
+                os.close(fd)
+                raise
+        with open(fd, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+            _ = f.write(payload)
+        if target_exists:
+            if os.name == 'nt':
+                if not _replace_file_keep_acl(path, tmp_path):
+                    # 原地覆盖写入, 和原来一样保留ACL
+                    with open(path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+                        _ = f.write(payload)
+                    os.remove(tmp_path)
+                return
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def keyfile_needs_copy(src: str, dst: str) -> bool:
+    """是否需要把密钥从 src 复制到 dst：
+    - dst 不存在: 需要复制
+    - dst 已存在但 src 不存在（密钥只放在输出目录）: 沿用 dst, 不复制
+    - 两者都存在: 大小或修改时间不一致时复制（copy2 会保留修改时间）
+    """
+    try:
+        dst_st = os.stat(dst)
+    except OSError:
+        return True
+    try:
+        src_st = os.stat(src)
+    except OSError:
+        return False
+    return src_st.st_size != dst_st.st_size or src_st.st_mtime_ns != dst_st.st_mtime_ns
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """复制文件并保留元数据：
+    - Windows 下优先调用 CopyFileW, 由系统完成复制
+    - 其他平台或 CopyFileW 失败时使用 shutil.copy2（Linux 下 copy2 本身已经用 sendfile 复制）
+    """
+    if os.name == 'nt':
+        try:
+            import ctypes
+            if ctypes.windll.kernel32.CopyFileW(src, dst, False):
+                shutil.copystat(src, dst)
+                return
+        except (OSError, AttributeError):
+            pass
+    _ = shutil.copy2(src, dst)
+
+
 def trans_keyfile_path(input_path: str) -> str:
     """规范化并准备SSH密钥文件路径：
     - 展开 ~ 为用户目录
     - 非绝对路径时，拼接到 SSHKEY_KEEP_DIR
-    - 将密钥复制到 SSHKEY_OUT_DIR（若不在该目录且目标不存在）
-    - 返回规范化后的最终路径
+    - 将密钥复制到 SSHKEY_OUT_DIR（若不在该目录且目标不存在或与源文件不一致）
+    - 返回规范化后的最终路径, 同一源路径只处理一次
     """
+    global _SSHKEY_OUT_DIR_READY
     # print(f'input_path: {input_path}')
     keyfile_path: str = input_path
     if keyfile_path.startswith('~'):
         keyfile_path = os.path.expanduser(keyfile_path)
     if not is_absolute_path(name=keyfile_path):
         keyfile_path = os.path.join(SSHKEY_KEEP_DIR, keyfile_path)
+    cached: str | None = _KEYFILE_CACHE.get(keyfile_path)
+    if cached is not None:
+        return cached
     final_keyfile_path: str = keyfile_path
     if os.path.dirname(keyfile_path) != SSHKEY_OUT_DIR:
         try:
-            os.makedirs(name=SSHKEY_OUT_DIR, exist_ok=True)
+            if not _SSHKEY_OUT_DIR_READY:
+                os.makedirs(name=SSHKEY_OUT_DIR, exist_ok=True)
+                _SSHKEY_OUT_DIR_READY = True
             final_keyfile_path = os.path.join(SSHKEY_OUT_DIR, os.path.basename(keyfile_path))
-            if not os.path.exists(final_keyfile_path):
-                _ = shutil.copy2(keyfile_path, final_keyfile_path)
+            if keyfile_needs_copy(keyfile_path, final_keyfile_path):
+                _fast_copy(keyfile_path, final_keyfile_path)
                 # 设置SSH密钥文件权限：只有文件所有者可以读写，其他用户无权限
                 try:
                     import stat
@@ -113,7 +223,9 @@ def trans_keyfile_path(input_path: str) -> str:
         except (OSError, IOError) as e:
             print(f"Warning: failed to prepare/copy key file to {SSHKEY_OUT_DIR}: {e}")
     # return os.path.expanduser(final_keyfile_path)
-    return os.path.normpath(final_keyfile_path)
+    final_keyfile_path = os.path.normpath(final_keyfile_path)
+    _KEYFILE_CACHE[keyfile_path] = final_keyfile_path
+    return final_keyfile_path
 
 
 class GenCmd:
@@ -267,23 +379,21 @@ class GenCmd:
                 proxyarg = f'-proxy={self.proxy_type}://{self.proxy_host}:{self.proxy_port}'
         else:
             proxyarg = '-noproxy'
-        if self.auth_type:
-            autharg = f'/auth={self.auth_type}'
-        else:
-            autharg = '/ask4passwd'
+        auth_parts: list[str] = [f'/auth={self.auth_type}' if self.auth_type else '/ask4passwd']
         if self.user:
-            autharg += f' /user={self.user}'
+            auth_parts.append(f'/user={self.user}')
         if self.keyfile:
             keyfile: str = trans_keyfile_path(input_path=self.keyfile)
-            autharg += f' /keyfile="{keyfile}"'
+            auth_parts.append(f'/keyfile="{keyfile}"')
         if self.password:
-            autharg += f' /password="{self.password}"'
-        cmd = ''
-        cmd += f'@echo off{os.linesep}'
-        cmd += f'start "" {exefile} {proxyarg} {self.host}:{self.port}'
-        cmd += f' /ssh {autharg} & {os.linesep}'
-        with open(outfile, 'w', encoding='utf-8') as f:
-            _ = f.write(cmd)
+            auth_parts.append(f'/password="{self.password}"')
+        autharg = ' '.join(auth_parts)
+        cmd = (f'@echo off{os.linesep}'
+               f'start "" {exefile} {proxyarg} {self.host}:{self.port}'
+               f' /ssh {autharg} & {os.linesep}')
+        # 一次写入; 换行已用 os.linesep, 以二进制写入避免再次转换
+        with open(outfile, 'wb') as f:
+            _ = f.write(cmd.encode('utf-8'))
         # print(cmd)
 
 
@@ -318,43 +428,93 @@ class GenCmd:
         # command for putty
         exefile = '"%programfiles%\\PuTTY\\putty.exe"'
         cork_exe = ('C:\\app\\ckcr\\ckcr.exe')
-        cmd = ''
-        cmd += f'@echo off{os.linesep}'
+        envline = ''
         if self.proxy_type and self.proxy_type == 'http':
             # 暂时只支持http
             if self.proxy_user:
-                cmd += f'set CORKSCREW_AUTH={self.proxy_user}:{self.proxy_password}{os.linesep}'
+                envline = f'set CORKSCREW_AUTH={self.proxy_user}:{self.proxy_password}{os.linesep}'
             proxyarg = ''' -proxycmd "\\"{}\\" {} {} %%host %%port"'''.format(
                 cork_exe.replace("\\","\\\\"), self.proxy_host, self.proxy_port)
         else:
             proxyarg = ''
-        autharg = ''
+        auth_parts: list[str] = []
         if self.user:
-            autharg += f' -l {self.user}'
+            auth_parts.append(f' -l {self.user}')
         if self.keyfile:
             keyfile: str = self.trans_putty_keyfile_name(self.keyfile)
             keyfile = trans_keyfile_path(input_path=keyfile)
-            autharg += f' -i "{keyfile}"'
+            auth_parts.append(f' -i "{keyfile}"')
         if self.password:
-            autharg += f' -pw "{self.password}"'
-        cmd += (f'start "" {exefile} -ssh -noshare '
-                f'{proxyarg} {autharg} '
-                f'-P {self.port} {self.host} & {os.linesep}')
-        with open(outfile, 'w', encoding='utf-8') as f:
-            _ = f.write(cmd)
+            auth_parts.append(f' -pw "{self.password}"')
+        autharg = ''.join(auth_parts)
+        cmd = (f'@echo off{os.linesep}'
+               f'{envline}'
+               f'start "" {exefile} -ssh -noshare '
+               f'{proxyarg} {autharg} '
+               f'-P {self.port} {self.host} & {os.linesep}')
+        # 一次写入; 换行已用 os.linesep, 以二进制写入避免再次转换
+        with open(outfile, 'wb') as f:
+            _ = f.write(cmd.encode('utf-8'))
 
 
 class HostConf:
     """SSH主机配置管理类"""
     def __init__(self):
         """初始化配置解析器并读取配置文件"""
-        self.conf_parser: configparser.ConfigParser = configparser.ConfigParser()
-        _ = self.conf_parser.read(MY_CONF_FILE, encoding='utf-8')
+        self.conf_parser: configparser.ConfigParser = self.load_conf()
         self.extend_asterisk()
         # self.compat_file()
         # self.compat_dir()
         # 改成统一从ini生成ssh-config写入到系统目录, 所以不从系统的ssh配置目录解析ssh配置了. ssh-host.ini就是最全的配置.
 
+    @staticmethod
+    def parse_conf_data() -> dict[str, dict[str, str]]:
+        """把ssh-host.ini解析成普通的 {section: {key: value}} 字典, 值保持原样不做插值
+        [DEFAULT] 也作为普通section读出, 各section只包含自己的键, 保证键的顺序不变
+        """
+        raw_parser = configparser.RawConfigParser(default_section='\0')
+        _ = raw_parser.read(MY_CONF_FILE, encoding='utf-8')
+        return {s: dict(raw_parser.items(s)) for s in raw_parser.sections()}
+
+    @staticmethod
+    def load_conf() -> configparser.ConfigParser:
+        """读取ssh-host.ini, 文件大小和修改时间与缓存记录一致时直接使用缓存的解析结果"""
+        conf_parser = configparser.ConfigParser()
+        try:
+            st = os.stat(MY_CONF_FILE)
+        except OSError:
+            _ = conf_parser.read(MY_CONF_FILE, encoding='utf-8')
+            return conf_parser
+        header = (st.st_size, st.st_mtime_ns)
+        # 缓存只是加速, 加载失败一律当作没有缓存
+        try:
+            with open(MY_CONF_CACHE_FILE, 'rb') as f:
+                cached_header, cached_data = pickle.load(f)
+            if cached_header == header and isinstance(cached_data, dict):
+                conf_parser.read_dict(cached_data)
+                return conf_parser
+        except Exception:
+            conf_parser = configparser.ConfigParser()
+        conf_data = HostConf.parse_conf_data()
+        conf_parser.read_dict(conf_data)
+        # 缓存含密码等信息, 使用和ssh-host.ini相同的权限; 先写 .tmp 再替换, 避免写到一半留下损坏的缓存
+        mode = st.st_mode & 0o7777
+        tmp_path = f'{MY_CONF_CACHE_FILE}.tmp'
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+            with open(fd, 'wb') as f:
+                if hasattr(os, 'fchmod'):
+                    os.fchmod(fd, mode)
+                pickle.dump((header, conf_data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, MY_CONF_CACHE_FILE)
+        except Exception as e:
+            print(f"Warning: failed to write config cache {MY_CONF_CACHE_FILE}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        return conf_parser
+
     def extend_section_with(self, sect):
         pattern = "^" + re.escape(sect).replace("\\*", ".*") + "$"
         r = re.compile(pattern)
@@ -390,16 +550,18 @@ class HostConf:
         hostnum = len(hostlist)
         idx = hostnum
         for line in lines:
-            if (re.search(r'^\s*#', line) or re.search(r'^\s*$', line)):
+            lstripped = line.lstrip()
+            if not lstripped or lstripped[0] == '#':
                 continue
-            if re.search(r'^\s*\bHost\b', line):
+            if _is_host_line(lstripped):
                 host = line.split('Host')[-1].split()[0]
                 idx += 1
                 hostlist.append({'Host': host})
             elif idx > hostnum:
-                key = line.split()[0]
-                value = ' '.join(line.split()[1:])
-                if re.search(r'^/[A-Za-z]/', value):
+                parts = lstripped.rstrip().split(None, 1)
+                key = parts[0]
+                value = parts[1] if len(parts) > 1 else ''
+                if _is_msys_drive_path(value):
                     value = value.replace('/', '', 1)
                     value = value.replace('/', ':\\', 1)
                     value = value.replace('/', '\\', -1)
@@ -433,9 +595,11 @@ class HostConf:
             host: str | None = None
             with open(full_path, 'r', encoding='utf8') as f:
                 for line in f.readlines():
-                    if re.search(r'\bHost\b', line):
+                    # 先用子串判断过滤掉绝大多数行, 再用正则确认单词边界
+                    if 'Host' in line and _HOST_WORD.search(line):
                         host = line.split('Host')[-1].split()[0]
-                    if not (re.search(r'^\s*#', line) or re.search(r'^\s*$', line)):
+                    lstripped = line.lstrip()
+                    if lstripped and lstripped[0] != '#':
                         # 仅在有 Host 后再记录有效行，避免无主机名配置
                         if host is not None:
                             lines.append(line)
@@ -450,10 +614,11 @@ class HostConf:
             self.conf_parser.add_section(host)
             for line in lines:
                 # print(line)
-                key = line.split()[0]
+                parts = line.strip().split(None, 1)
+                key = parts[0]
                 if key == 'Host':
                     continue
-                value = ' '.join(line.split()[1:])
+                value = parts[1] if len(parts) > 1 else ''
                 self.conf_parser.set(host, key, value)
 
 
@@ -465,6 +630,10 @@ class FixUpper:
         self.conf_parser: ConfigParser = configparser.ConfigParser()
         _ = self.conf_parser.read(UPPER_CONF_FILE, encoding='utf-8')
         self.section: str = 'upper'
+        # 一次性读出映射表, 避免每个键都走ConfigParser.get
+        self._map: dict[str, str] = {}
+        if self.conf_parser.has_section(self.section):
+            self._map = dict(self.conf_parser.items(self.section, raw=True))
     def get(self, option: str) -> str:
         """获取配置键名对应的大写形式
 
@@ -474,13 +643,7 @@ class FixUpper:
         Returns:
             转换后的大写键名，如果未配置则返回原键名
         """
-        s = self.section
-        c = self.conf_parser
-        o: str = option
-        if c.has_option(s, o):
-            return str(c.get(s, o, raw=True))
-        else:
-            return o
+        return self._map.get(self.conf_parser.optionxform(option), option)
 
 
 def gen_ssh_proxy_command(proxy_type, **kv):
@@ -556,16 +719,16 @@ def main() -> None:
     """主函数：生成SSH配置和连接脚本"""
     conf_parser: ConfigParser = HostConf().conf_parser
     fix_upper = FixUpper()
+    os.makedirs(name=TTH_OUT_DIR, exist_ok=True)
+    os.makedirs(name=PTH_OUT_DIR, exist_ok=True)
     ssh_cfg_list: list[str] = []
     for section in conf_parser.sections():
         ssh_cfg_line = f'Host {section}'
-        # print(ssh_cfg_line)
         ssh_cfg_list.append(ssh_cfg_line + '\n')
         conf = conf_parser[section]
         need_proxy = False
-        for key in conf.keys():
-            value: str = conf.get(key) or ""
-            if value == "":
+        for key, value in conf.items():
+            if not value:
                 continue
             if key.lower() == "identityfile":
                 processed: str = trans_keyfile_path(input_path=value)
@@ -574,7 +737,6 @@ def main() -> None:
                 need_proxy = True
             key_with_upper: str = fix_upper.get(option=key)
             ssh_cfg_line: str = f'    {key_with_upper} {value}'
-            # print(ssh_cfg_line)
             ssh_cfg_list.append(ssh_cfg_line + '\n')
         if need_proxy:
             proxy_cmd = gen_ssh_proxy_command(
@@ -587,25 +749,22 @@ def main() -> None:
             if proxy_cmd:
                 ssh_cfg_list.append(f'    {proxy_cmd}\n')
         cmd: GenCmd = GenCmd(section, conf)
-        os.makedirs(name=TTH_OUT_DIR, exist_ok=True)
         cmd.tth(outfile=os.path.join(TTH_OUT_DIR, f'{section}.bat'))
-        os.makedirs(name=PTH_OUT_DIR, exist_ok=True)
         cmd.pth(outfile=os.path.join(PTH_OUT_DIR, f'{section}.bat'))
+    payload: str = ''.join(ssh_cfg_list)
     # AUTO_SSH_CFG_FILE 自动生成的文件, 不用备份
-    with open(AUTO_SSH_CFG_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(ssh_cfg_list)
+    write_file_atomic(AUTO_SSH_CFG_FILE, payload)
     # USER_SSH_CFG_FILE 写入之前加个备份
     try:
         user_cfg_path: str = os.path.join(USER_SSH_CFG_FILE)
         if os.path.isfile(user_cfg_path):
             ts = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
             bak_path = f"{user_cfg_path}.bak-{ts}"
-            _ = shutil.copy2(user_cfg_path, bak_path)
+            _fast_copy(user_cfg_path, bak_path)
             print(f"Backup created: {bak_path}")
     except (OSError, IOError) as e:
         print(f"Warning: failed to backup {USER_SSH_CFG_FILE}: {e}")
-    with open(USER_SSH_CFG_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(ssh_cfg_list)
+    write_file_atomic(USER_SSH_CFG_FILE, payload)
 
 if __name__ == '__main__':
     main()